@@ -1,19 +1,35 @@
 import copy
 import csv
 import io
+import json
+import lzma
+import mmap
+import os
+import re
 import struct
-from dataclasses import dataclass
+import sys
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
 from enum import Enum, Flag, auto
+from functools import partial
 from io import BytesIO
 from pathlib import Path
-from struct import unpack
-from typing import Any, Dict, List, Tuple, Union
+from struct import unpack, unpack_from
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple, Union
 
 # from numba import jit
 import typer
 from art import text2art
 from rich import print
 from rich.console import Console
+from rich.table import Table
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # Based on https://github.com/owodzeg/PacViewer
 
@@ -24,6 +40,27 @@ class Game(str, Enum):
     P3 = "P3"
 
 
+class RegionType(str, Enum):
+    STRING_TABLE = "STRING_TABLE"
+    JUMP_TABLE = "JUMP_TABLE"
+    RAW_BYTES = "RAW_BYTES"
+
+
+class StringsFormat(str, Enum):
+    PO = "po"
+    CSV = "csv"
+
+
+class Compression(str, Enum):
+    NONE = "none"
+    LZMA = "lzma"
+    ZSTD = "zstd"
+
+
+class DecodeError(Exception):
+    pass
+
+
 class InstType(Flag):
     INT = auto()
     UINT = auto()
@@ -53,6 +90,9 @@ class InstParam:
     type: InstType = None
     type_str: str = None
     value: Any = None
+    offset: int = None
+    # T_ params: index of the paired V_ param
+    value_index: int = None
 
     @property
     def name_var(self):
@@ -69,6 +109,60 @@ class Instruction:
     offset: int = None
 
 
+@dataclass
+class DecodeIssue:
+    offset: int = None
+    message: str = None
+
+
+@dataclass
+class PacReport:
+    path: str = None
+    game: Game = None
+    # Malformed instructions kept as RAW_BYTES and other warnings
+    issues: List[DecodeIssue] = field(default_factory=list)
+    # Set if the PAC file couldn't be decoded at all
+    error: str = None
+    # With --detect, score of the game and margin over the next one (see
+    # detect_game)
+    detect_score: int = None
+    detect_margin: int = None
+
+
+@dataclass
+class PacStats:
+    path: str = None
+    game: Game = None
+    size: int = 0
+    # Bytes of the instructions in the instruction set, of the unk_ ones and
+    # of the regions between instructions by type. Only the unk_ and
+    # RAW_BYTES ones aren't understood.
+    known_bytes: int = 0
+    unknown_bytes: int = 0
+    string_table_bytes: int = 0
+    jump_table_bytes: int = 0
+    raw_bytes: int = 0
+    issues: int = 0
+    # (type_id, type_subid) -> params size -> count
+    opcodes: Dict[Tuple[int, int], Counter] = field(default_factory=dict)
+    # Set if the PAC file couldn't be analyzed at all
+    error: str = None
+
+    @property
+    def coverage(self) -> float:
+        if self.size == 0:
+            return 1.0
+        return 1 - (self.unknown_bytes + self.raw_bytes) / self.size
+
+
+@dataclass
+class StringEntry:
+    text: str = None
+    translation: str = ""
+    # (PAC path relative to the input folder, offset)
+    refs: List[Tuple[str, int]] = field(default_factory=list)
+
+
 def get_ids(csv_path: Path) -> Dict[int, str]:
     ids: Dict[int, str] = {}
     with open(csv_path, newline="", encoding="utf-8") as csvfile:
@@ -81,6 +175,20 @@ def get_ids(csv_path: Path) -> Dict[int, str]:
     return ids
 
 
+def get_value_index(params: List[InstParam], param: InstParam) -> int:
+    # Index of the V_ param paired with the T_ param, None if there isn't one
+    value_type_str = "V_" + param.type_str.split("T_")[1]
+    # eg: V_2_KEYBIND_ID
+    for i, p in enumerate(params):
+        if p.type_str.startswith(value_type_str + "_"):
+            return i
+    # eg: V_2
+    for i, p in enumerate(params):
+        if p.type_str == value_type_str:
+            return i
+    return None
+
+
 def get_instruction_set(file_path="p2_instruction_set.csv") -> List[Instruction]:
     instructions_set: List[Instruction] = []
     with open(file_path, newline="", encoding="utf-8") as csvfile:
@@ -121,8 +229,9 @@ def get_instruction_set(file_path="p2_instruction_set.csv") -> List[Instruction]
                     elif "LOOT_ID" in param.type_str:
                         type = InstType.LOOT_ID
                     else:
-                        print(f'Invalid type: {param.type_str} at "{param.name}"')
-                        exit(1)
+                        raise ValueError(
+                            f'Invalid type: {param.type_str} at "{param.name}"'
+                        )
                     if "_P" in param.type_str:
                         type |= InstType.P
                     elif "COUNT_" in param.type_str:
@@ -140,6 +249,9 @@ def get_instruction_set(file_path="p2_instruction_set.csv") -> List[Instruction]
 
                     param.type = type
                     params.append(param)
+            for param in params:
+                if param.type == InstType.T:
+                    param.value_index = get_value_index(params, param)
             inst = Instruction(
                 type_id=int(type_id_col, 16),
                 type_subid=int(type_subid_col, 16),
@@ -153,6 +265,121 @@ def get_instruction_set(file_path="p2_instruction_set.csv") -> List[Instruction]
     return instructions_set
 
 
+def get_params_size(inst: Instruction) -> int:
+    size = 0
+    for p in inst.params:
+        if (
+            InstType.STR in p.type
+            or InstType.COUNT in p.type
+            or InstType.CONTINUOUS in p.type
+        ):
+            return -1
+        size += 4
+    return size
+
+
+# T_ values of the variables, the others are immediates (0x10, 0x2) or an
+# index (0x1)
+VARIABLE_KINDS = {
+    0x40: "FloatGlobal",
+    0x20: "FloatLocal",
+    0x8: "IntGlobal",
+    0x4: "IntLocal",
+}
+
+# Access of the first operand of the arithmetic instructions, that store their
+# result in it. Their other operands are read.
+FIRST_OPERAND_ACCESS = {
+    "cmd_mov": ("write",),
+    "cmd_rand": ("write",),
+    "cmd_sinf": ("write",),
+    "cmd_cosf": ("write",),
+    "cmd_abs": ("write",),
+    "cmd_add": ("read", "write"),
+    "cmd_sub": ("read", "write"),
+    "cmd_mul": ("read", "write"),
+    "cmd_div": ("read", "write"),
+    "cmd_mod": ("read", "write"),
+    "cmd_inc": ("read", "write"),
+    "cmd_dec": ("read", "write"),
+    "cmd_iand": ("read", "write"),
+    "cmd_ior": ("read", "write"),
+    "cmd_ixor": ("read", "write"),
+    "cmd_irol": ("read", "write"),
+    "cmd_iror": ("read", "write"),
+    "cmd_loop": ("read", "write"),
+}
+
+# Accesses counted for each variable slot. The guessed ones come from the
+# instruction names only (see guess_access).
+VARIABLE_ACCESSES = ("read", "write", "guessed_read", "guessed_write")
+
+# Instructions whose first operand is guessed to be written
+GUESSED_FIRST_OPERAND_WRITE = {"cmd_result", "cmd_memset", "cmd_memcpy"}
+
+
+def guess_access(type_name: str, i: int, num_operands: int) -> str:
+    # Access of the operand i of the instructions not in FIRST_OPERAND_ACCESS,
+    # guessed from their names
+    if type_name.startswith("get"):
+        # eg: getGimmickHitPoint(id, hp), getGimmickPosition(id, x, y)
+        written = i > 0 or num_operands == 1
+    elif type_name.startswith("is"):
+        # eg: isEnableJump(result), isHero(id, unk, result)
+        written = i == num_operands - 1
+    else:
+        written = i == 0 and type_name in GUESSED_FIRST_OPERAND_WRITE
+    return "guessed_write" if written else "guessed_read"
+
+
+def get_operands(inst: Instruction) -> List[Tuple[int, int, Tuple[str, ...]]]:
+    # (T_ position, V_ position, access) of the T_/V_ pairs, positions are
+    # relative to the instruction offset. Only the params before the first one
+    # with a variable size (STR, COUNT, CONTINUOUS) have a known position.
+    positions: Dict[int, int] = {}
+    for i, p in enumerate(inst.params):
+        if (
+            InstType.STR in p.type
+            or InstType.COUNT in p.type
+            or InstType.CONTINUOUS in p.type
+        ):
+            break
+        positions[i] = 4 + i * 4
+    pairs = [
+        (positions[i], positions[p.value_index])
+        for i, p in enumerate(inst.params)
+        if p.type == InstType.T and i in positions and p.value_index in positions
+    ]
+    operands: List[Tuple[int, int, Tuple[str, ...]]] = []
+    for i, (t_position, v_position) in enumerate(pairs):
+        if inst.type_name not in FIRST_OPERAND_ACCESS:
+            access = (guess_access(inst.type_name, i, len(pairs)),)
+        elif i == 0:
+            access = FIRST_OPERAND_ACCESS[inst.type_name]
+        else:
+            access = ("read",)
+        operands.append((t_position, v_position, access))
+    return operands
+
+
+def get_opcodes_histogram(buffer) -> Counter:
+    # (type_id, type_subid, params size) of the instruction headers,
+    # found with the same rules used by get_inst_raw_bytes
+    headers: List[Tuple[int, int, int]] = []
+    for m in re.finditer(b"\x25", buffer):
+        offset = m.start()
+        if offset % 4 != 0 or offset + 4 > len(buffer):
+            continue
+        _, inst_id, inst_subid = unpack_from("BBH", buffer, offset)
+        if inst_id < 0x22 and inst_subid != 0x00 and inst_subid < 0x2400:
+            headers.append((offset, inst_id, inst_subid))
+    histogram = Counter()
+    for i, (offset, inst_id, inst_subid) in enumerate(headers):
+        next_offset = headers[i + 1][0] if i + 1 < len(headers) else len(buffer)
+        histogram[(inst_id, inst_subid, next_offset - offset - 4)] += 1
+    return histogram
+
+
 def get_last_offset(infile) -> int:
     current_offset = infile.tell()
     infile.seek(0, io.SEEK_END)
@@ -161,18 +388,19 @@ def get_last_offset(infile) -> int:
     return last_offset
 
 
-def get_inst_raw_bytes(infile, last_offset: int) -> bytearray:
-    raw_bytes = bytearray(infile.read(4))
+def get_inst_raw_bytes(buffer, offset: int) -> Tuple[bytearray, int]:
+    # Returns the bytes from offset to the next instruction and its offset
+    last_offset = len(buffer)
+    next_offset = min(offset + 4, last_offset)
     # print("-")
-    if infile.tell() < last_offset:
-        raw_4_bytes = infile.read(4)
-        inst_magic, inst_id, inst_subid = unpack("BBH", raw_4_bytes)
+    if next_offset < last_offset:
+        inst_magic, inst_id, inst_subid = unpack_from("BBH", buffer, next_offset)
         # if infile.tell() == last_offset:
         #     raw_bytes.extend(raw_4_bytes)
         # else:
         # i = 1
         # while inst_magic != 0x25 and inst_subid != 0x00 and infile.tell() < last_offset:
-        while infile.tell() < last_offset:
+        while next_offset + 4 < last_offset:
             # print(f"{i}")
             # i += 1
             # TODO First get size looking at instructions_set.csv
@@ -184,17 +412,13 @@ def get_inst_raw_bytes(infile, last_offset: int) -> bytearray:
                 and inst_subid < 0x2400
             ):
                 break
-            raw_bytes.extend(raw_4_bytes)
-            raw_4_bytes = infile.read(4)
-            inst_magic, inst_id, inst_subid = unpack("BBH", raw_4_bytes)
-        # if infile.tell() == last_offset:
-        #     raw_bytes.extend(raw_4_bytes)
-        # else:
-        # if len(raw_bytes) > 4:
-        infile.seek(infile.tell() - 4)
-        # print (f"{infile.tell():08X}")
+            next_offset += 4
+            inst_magic, inst_id, inst_subid = unpack_from("BBH", buffer, next_offset)
+        # Without a next instruction, the last 4 bytes are read as the next one
+        # print (f"{next_offset:08X}")
+    raw_bytes = bytearray(buffer[offset:next_offset])
     # print (" ".join([f"{b:02X}" for b in raw_bytes]))
-    return raw_bytes
+    return raw_bytes, next_offset
 
 
 def get_str_params(
@@ -250,12 +474,49 @@ def get_str_params(
             str_params += " ".join([f"{b:02X}" for b in p.value])
         else:
             # str_params += f"{p.value}"
-            print(f"{params} {p.type}")
-            exit()
+            raise DecodeError(f"Unexpected param type {p.type} in {params}")
 
     return str_params
 
 
+def classify_region(region_bytes: bytearray) -> List[Tuple[RegionType, Any]]:
+    # A region is decoded once as shift_jis and unpacked once as offsets
+    regions: List[Tuple[RegionType, Any]] = []
+    try:
+        text = bytes(region_bytes).decode("shift_jis")
+        regions.append((RegionType.STRING_TABLE, text.rstrip("\x00").split("\x00")))
+    except UnicodeDecodeError:
+        text = None
+    if len(region_bytes) % 4 != 0:
+        regions.append((RegionType.RAW_BYTES, region_bytes))
+    else:
+        offsets = [o for (o,) in struct.iter_unpack("I", region_bytes)]
+        # size of p2 unitbase = 0xB8A8C
+        if text is None or all(o <= 0xC0000 for o in offsets):
+            regions.append((RegionType.JUMP_TABLE, offsets))
+    return regions
+
+
+def is_string_table(regions: List[Tuple[RegionType, Any]]) -> bool:
+    # Offsets tables and raw bytes can be valid shift_jis too, so only the
+    # regions classified as nothing but a STRING_TABLE of text are strings
+    if [region_type for region_type, _ in regions] != [RegionType.STRING_TABLE]:
+        return False
+    for text in regions[0][1]:
+        for c in text:
+            if (ord(c) < 0x20 or ord(c) == 0x7F) and c not in "\n\t":
+                return False
+    return True
+
+
+def get_str_region(region_type: RegionType, value: Any) -> str:
+    if region_type == RegionType.STRING_TABLE:
+        return str(value)
+    elif region_type == RegionType.JUMP_TABLE:
+        return ", ".join([f"{o:X}" for o in value])
+    return " ".join([f"{b:02X}" for b in value])
+
+
 def print_new_types(instructions: List[Union[Instruction, Tuple[int, bytearray]]]):
     inst_sizes = set()
     for i, inst in enumerate(instructions):
@@ -294,6 +555,1185 @@ def print_new_types(instructions: List[Union[Instruction, Tuple[int, bytearray]]
         print(string)
 
 
+def append_raw_bytes(
+    instructions: List[Union[Instruction, Tuple[int, bytearray]]],
+    offset: int,
+    raw_bytes: bytearray,
+):
+    if len(instructions) > 0 and isinstance(instructions[-1], Tuple):
+        instructions[-1][1].extend(raw_bytes)
+    else:
+        instructions.append((offset, bytearray(raw_bytes)))
+
+
+class Decoder:
+    # Decoder of the PAC files of a game. It keeps no state between calls, so
+    # it can be built once and used for any number of buffers.
+
+    def __init__(self, game: Game, csv_folder: Path = Path(__file__).parent):
+        self.game = game
+        # (type_id, type_subid) -> Instruction
+        self.instructions_set: Dict[Tuple[int, int], Instruction] = {}
+        for inst in get_instruction_set(
+            csv_folder.joinpath(f"{game.value.lower()}_instruction_set.csv")
+        ):
+            self.instructions_set[(inst.type_id, inst.type_subid)] = inst
+        # (type_id, type_subid) -> size of the params, -1 if it depends on them
+        self.params_sizes: Dict[Tuple[int, int], int] = {
+            k: get_params_size(i) for k, i in self.instructions_set.items()
+        }
+        # (type_id, type_subid) -> T_/V_ operands, see get_operands
+        self.operands: Dict[Tuple[int, int], List[Tuple[int, int, Tuple[str, ...]]]] = {
+            k: get_operands(i) for k, i in self.instructions_set.items()
+        }
+        self.keybinds = get_ids(csv_folder.joinpath("keybinds.csv"))
+        self.loot = get_ids(csv_folder.joinpath(f"{game.value.lower()}_loot.csv"))
+
+    def decode(
+        self, buffer, issues: List[DecodeIssue] = None, resilient: bool = False
+    ) -> List[Union[Instruction, Tuple[int, bytearray]]]:
+        # buffer can be bytes, bytearray, memoryview or mmap
+        return list(self.iter_decode(buffer, issues, resilient))
+
+    def iter_decode(
+        self, buffer, issues: List[DecodeIssue] = None, resilient: bool = False
+    ) -> Iterator[Union[Instruction, Tuple[int, bytearray]]]:
+        # Yields the instructions and the (offset, bytes) regions between them
+        # as soon as they are complete. Warnings are added to issues. Malformed
+        # instructions raise DecodeError or, if resilient, are kept as raw bytes.
+        last_offset = len(buffer)
+
+        # The last item is kept until the next one, a raw bytes region can grow
+        instructions: List[Union[Instruction, Tuple[int, bytearray]]] = []
+
+        next_offset = 0
+        while next_offset < last_offset:
+            offset = next_offset
+            if len(instructions) > 1 or (
+                len(instructions) == 1 and not isinstance(instructions[0], Tuple)
+            ):
+                keep = 1 if isinstance(instructions[-1], Tuple) else 0
+                yield from instructions[: len(instructions) - keep]
+                del instructions[: len(instructions) - keep]
+            try:
+                raw_bytes, next_offset = get_inst_raw_bytes(buffer, offset)
+                # exit()
+                # raw_bytes_str = " ".join([f"{b:02X}" for b in raw_bytes])
+                inst_magic, inst_id, inst_subid = unpack("BBH", raw_bytes[0:4])
+            except struct.error as e:
+                # The file size isn't a multiple of 4
+                message = f"Truncated instruction: {e}"
+                if not resilient:
+                    raise DecodeError(f"{offset:08X} {message}") from e
+                if issues is not None:
+                    issues.append(DecodeIssue(offset, message))
+                append_raw_bytes(instructions, offset, bytearray(buffer[offset:]))
+                break
+            params_bytes = raw_bytes[4:]
+            params_io = BytesIO(params_bytes)
+            # print (len(params_bytes))
+            # exit()
+            if inst_magic != 0x25:
+                append_raw_bytes(instructions, offset, raw_bytes)
+            else:
+                inst = Instruction(
+                    type_id=inst_id,
+                    type_subid=inst_subid,
+                    type_name=f"unk_{inst_id:02X}_{inst_subid:04X}",
+                    desc="Unk",
+                    # size_bytes_params=-1,
+                    params=[
+                        InstParam(name=None, type=InstType.BYTES, type_str="bytes")
+                    ],
+                )
+                if (inst_id, inst_subid) in self.instructions_set:
+                    inst = copy.deepcopy(self.instructions_set[(inst_id, inst_subid)])
+                inst.offset = offset
+                # if inst_magic != 0x25 and infile.tell() < last_offset:
+                # outfile.write(f"{offset:08X} {raw_bytes_io}\n")
+                # raw_bytes_parsed = 0
+                # while raw_bytes_parsed <len(params_bytes):
+                # if len(inst.params) == 1 and inst.params[0].type == InstType.BYTES:
+                # inst.params[0].value = params_bytes
+                # print (f"{offset:08X}")
+
+                try:
+
+                    for i in range(len(inst.params)):
+                        param: InstParam = inst.params[i]
+                        if param.type == InstType.BYTES:
+                            param.value = params_bytes
+                        elif param.type == InstType.STR:
+                            # # text = params_io.read(4)
+                            # text = unpack("4s", params_io.read(4))[0].decode("shift_jis")
+                            # while text[-1] != "\x00":
+                            #     text += unpack("4s", params_io.read(4))[0].decode("shift_jis")
+                            params_last_offset = get_last_offset(params_io)
+                            param.offset = offset + 4 + params_io.tell()
+                            text_bytes = params_io.read(1)
+                            if text_bytes == b"":
+                                raise DecodeError("Missing STR param")
+                            while (
+                                text_bytes[-1] != 0x00
+                                and params_io.tell() < params_last_offset
+                            ):
+                                text_bytes += params_io.read(1)
+                                # print(f"{infile.tell():08X}")
+                                # print(text_bytes[-1])
+                            # text = unpack(f"{len(text_bytes)}s", bytearray(text_bytes))[0].decode("cp932").rstrip("\x00")
+                            text = (
+                                unpack(f"{len(text_bytes)}s", bytearray(text_bytes))[0]
+                                .decode("shift_jis")
+                                .rstrip("\x00")
+                            )
+                            # if (
+                            #     i == len(inst.params) - 1
+                            # ):  # read variables if str is the last parameter
+                            #     text_variables = params_io.read()
+                            #     # if len(text_variables) > 0:
+                            #     #     if len(text_variables) >= 4:
+                            #     #         text += "{"
+                            #     #         chunks = [
+                            #     #             text_variables[i : i + 4]
+                            #     #             for i in range(0, len(text_variables), 4)
+                            #     #         ]
+                            #     #         chunk_count = 0
+                            #     #         for chunk in chunks:
+                            #     #             if len(chunk) == 4:
+                            #     #                 # if chunk != b"\x00" * 4:
+                            #     #                 # text += " ".join([f"{b:02X}" for b in chunk])
+                            #     #                 text += " " if chunk_count > 0 else ""
+                            #     #                 text += f"{unpack(f'I', chunk)[0]:08X}"
+                            #     #                 chunk_count += 1
+                            #     #             elif chunk != b"\x00" * len(chunk):
+                            #     #                 print("Error 1. Expecting padding")
+                            #     #                 exit()
+                            #     #         text += "}"
+                            #     #         # text += (
+                            #     #         #     "{" + " ".join([f"{b:02X}" for b in text_variables]) + "}"
+                            #     #         # )
+                            #     #     elif text_variables != b"\x00" * len(text_variables):
+                            #     #         print("Error 2. Expecting padding")
+                            #     #         exit()
+                            #     chunks = [
+                            #         text_variables[i : i + 4]
+                            #         for i in range(0, len(text_variables), 4)
+                            #     ]
+                            #     if (
+                            #         len(chunks) > 0
+                            #         and len(chunks[-1]) < 4
+                            #         and chunks[-1] == b"\x00" * len(chunks[-1])
+                            #     ):
+                            #         chunks = chunks[0:-1]
+                            #     if len(chunks) > 0:
+                            #         text += (
+                            #             "{"
+                            #             + " ".join(
+                            #                 [f"{b:02X}" for b in b"".join(chunks)]
+                            #             )
+                            #             + "}"
+                            #         )
+                            # else:
+                            #     # Read padding
+                            #     if params_io.tell() % 4 != 0:
+                            #         padding_size = (
+                            #             (params_io.tell() // 4) + 1
+                            #         ) * 4 - params_io.tell()
+                            #         padding = params_io.read(padding_size)
+                            #         if padding != b"\x00" * len(padding):
+                            #             print(
+                            #                 f"Error. Expecting padding. Found {padding}"
+                            #             )
+                            #             # exit()
+
+                            param.value = text
+                            # break
+                        elif param.type == InstType.T:
+                            param.value = unpack(f"I", params_io.read(4))[0]
+                            value_index = param.value_index
+
+                            # If V_2_KEYBIND_ID or V_2
+                            if value_index is not None:
+                                # 0x40 - FloatGlobal
+                                # 0x20 - FloatLocal
+                                # 0x10 - FloatImm
+                                # 0x8 - IntGlobal
+                                # 0x4 - IntLocal
+                                # 0x2 - IntImm
+                                # 0x1 - Index
+                                # 0x0 - None
+                                if (
+                                    param.value == 0x10
+                                    or param.value == 0x20
+                                    or param.value == 0x40
+                                ):  # float
+                                    inst.params[value_index].type |= InstType.FLOAT
+                                elif (
+                                    param.value == 0x1
+                                    or param.value == 0x2
+                                    or param.value == 0x4
+                                    or param.value == 0x8
+                                ):  # int, short, uint, ushort?
+                                    inst.params[value_index].type |= InstType.INT
+                                # elif (
+                                #     param.value == 0x20
+                                # ):  # int, short, uint, ushort?
+                                #     inst.params[value_index].type |= InstType.UINT
+                                else:  # 0x4, 0x8, 0x40
+                                    inst.params[value_index].type |= InstType.INT
+                                    # TODO
+                                    message = f"{inst.type_name} Unknown Type 0x{param.value:X}"
+                                    if issues is not None:
+                                        issues.append(DecodeIssue(offset, message))
+                                    # exit(1)
+                        elif InstType.CONTINUOUS in param.type:
+                            sub_param_type = InstType.UINT
+                            sub_param_type_str = "UINT"
+                            if InstType.UINT in param.type:
+                                sub_param_type = InstType.UINT
+                                sub_param_type_str = "UINT"
+                            elif InstType.INT in param.type:
+                                sub_param_type = InstType.INT
+                                sub_param_type_str = "INT"
+                            elif InstType.FLOAT in param.type:
+                                sub_param_type = InstType.FLOAT
+                                sub_param_type_str = "FLOAT"
+                            name_var = param.name_var
+                            inst.params.remove(param)
+                            params_last_offset = get_last_offset(params_io)
+                            num_params = (params_last_offset - params_io.tell()) // 4
+                            for c in range(num_params):
+                                sub_param = InstParam()
+                                sub_param.type = sub_param_type
+                                sub_param.type_str = sub_param_type_str
+                                # sub_param.name = f"continuous{c+1}"
+                                sub_param.name = f"{name_var}_{c+1}"
+                                if sub_param_type == InstType.UINT:
+                                    sub_param.value = unpack(f"I", params_io.read(4))[0]
+                                elif sub_param_type == InstType.INT:
+                                    sub_param.value = unpack(f"i", params_io.read(4))[0]
+                                elif sub_param_type == InstType.FLOAT:
+                                    sub_param.value = float(
+                                        "{:.4f}".format(
+                                            unpack(f"f", params_io.read(4))[0]
+                                        )
+                                    )
+                                else:
+                                    raise DecodeError(
+                                        f"Error Continuous unk {sub_param_type=}"
+                                    )
+                                inst.params.append(sub_param)
+                            break
+                        elif InstType.COUNT in param.type:
+                            count = unpack(f"I", params_io.read(4))[0]
+                            param.value = count
+                            sub_param_type = InstType.UINT
+                            sub_param_type_str = "UINT"
+                            if InstType.UINT in param.type:
+                                sub_param_type = InstType.UINT
+                                sub_param_type_str = "UINT"
+                            elif InstType.INT in param.type:
+                                sub_param_type = InstType.INT
+                                sub_param_type_str = "INT"
+                            elif InstType.FLOAT in param.type:
+                                sub_param_type = InstType.FLOAT
+                                sub_param_type_str = "FLOAT"
+                            # inst.params.remove(param)
+                            for c in range(count):
+                                sub_param = InstParam()
+                                sub_param.type = sub_param_type
+                                sub_param.type_str = sub_param_type_str
+                                # sub_param.name = f"count{c+1}"
+                                sub_param.name = f"{param.name_var}_{c+1}"
+                                if sub_param_type == InstType.UINT:
+                                    sub_param.value = unpack(f"I", params_io.read(4))[0]
+                                elif sub_param_type == InstType.INT:
+                                    sub_param.value = unpack(f"i", params_io.read(4))[0]
+                                elif sub_param_type == InstType.FLOAT:
+                                    sub_param.value = float(
+                                        "{:.4f}".format(
+                                            unpack(f"f", params_io.read(4))[0]
+                                        )
+                                    )
+                                else:
+                                    raise DecodeError(f"Error Count {sub_param_type=}")
+                                inst.params.append(sub_param)
+                            # TODO Check if there are more parameters after the COUNT
+                            break
+                        elif InstType.UINT in param.type:
+                            try:
+                                param.value = unpack(f"I", params_io.read(4))[0]
+                            except Exception as e:
+                                # print(e)
+                                # print(output)
+                                # print(inst)
+                                # exit()
+                                # p2 setSoundGameSkipLabel: the offset arg is optional
+                                # param.value = -1
+                                pass
+                        elif InstType.INT in param.type:
+                            param.value = unpack(f"i", params_io.read(4))[0]
+                        elif InstType.FLOAT in param.type:
+                            param.value = float(
+                                "{:.4f}".format(unpack(f"f", params_io.read(4))[0])
+                            )
+                        elif param.type == InstType.ENTITY_ID:
+                            param.value = unpack(f"I", params_io.read(4))[0]
+                        elif param.type == InstType.EQUIP_ID:
+                            param.value = unpack(f"I", params_io.read(4))[0]
+                        elif param.type == InstType.KEYBIND_ID:
+                            param.value = unpack(f"I", params_io.read(4))[0]
+                        elif param.type == InstType.LOOT_ID:
+                            param.value = unpack(f"I", params_io.read(4))[0]
+                except (struct.error, UnicodeDecodeError, DecodeError) as e:
+                    message = f'Error "{inst.type_name}": {e}'
+                    if not resilient:
+                        raise DecodeError(f"{offset:08X} {message}") from e
+                    if issues is not None:
+                        issues.append(DecodeIssue(offset, message))
+                    append_raw_bytes(instructions, offset, raw_bytes)
+                    continue
+                # outfile.write(f"{inst.offset:08X}  {inst.type_name}  {inst.params}\n")
+                instructions.append(inst)
+
+                bytes_parsed = 0
+                for param in inst.params:
+                    if param.type == InstType.STR:
+                        bytes_parsed = -1
+                        break
+                    else:
+                        if param.value is not None:
+                            # p2 setSoundGameSkipLabel: the offset arg is optional
+                            bytes_parsed += 4
+                if bytes_parsed != -1:
+                    if (
+                        len(params_bytes) != bytes_parsed
+                        and not "unk_" in inst.type_name
+                    ):
+                        # print (inst)
+                        # print (len(params_bytes))
+                        # print (bytes_parsed)
+                        # exit()
+                        # offset = inst.offset + 4 + bytes_parsed
+                        # inst = Instruction(
+                        #     type_id=inst_id,
+                        #     type_subid=inst_subid,
+                        #     type_name=f"RAW_BYTES_INST",
+                        #     desc="Unk",
+                        #     offset=offset,
+                        #     params=[
+                        #         InstParam(
+                        #             name=None,
+                        #             type=InstType.BYTES,
+                        #             type_str="bytes",
+                        #             value=params_bytes[bytes_parsed:],
+                        #             # value=params_bytes,
+                        #         )
+                        #     ],
+                        # )
+                        # instructions.append(inst)
+                        # infile.seek(infile.tell() - len(params_bytes) + bytes_parsed)
+                        append_raw_bytes(
+                            instructions,
+                            inst.offset + 4 + bytes_parsed,
+                            params_bytes[bytes_parsed:],
+                        )
+                # break
+
+        yield from instructions
+
+    def iter_listing(
+        self, instructions: Iterable[Union[Instruction, Tuple[int, bytearray]]]
+    ) -> Iterator[str]:
+        # Lines of the TXT listing
+        for i, inst in enumerate(instructions):
+            if isinstance(inst, Tuple):
+                offset, region_bytes = inst
+                if i != 0:
+                    regions = classify_region(region_bytes)
+                else:
+                    regions = [(RegionType.RAW_BYTES, region_bytes)]
+                for region_type, value in regions:
+                    yield f"{offset:08X}  {region_type.value} {get_str_region(region_type, value)}\n"
+            else:
+                yield f"{inst.offset:08X}  {inst.type_name}({get_str_params(inst.params, self.keybinds, self.loot)})\n"
+                # yield f"{inst.offset:08X}  {inst.type_name}  {inst.params}\n"
+
+
+def detect_game(buffer, decoders: List[Decoder]) -> Tuple[Decoder, int, int]:
+    # The game whose instruction set best matches the opcodes found in the
+    # file: each instruction with the right params size counts for the game
+    # and each one missing or with another size counts against it. Ties go to
+    # the game with more matches of a fixed params size, then on named opcodes
+    # (the p1 set only has unk_ placeholders), then to the first game in the
+    # list. Returns the decoder, its score and the margin over the next game,
+    # 0 for ambiguous files.
+    histogram = get_opcodes_histogram(buffer)
+    scores: List[Tuple[int, int, int]] = []
+    for decoder in decoders:
+        score = 0
+        fixed_score = 0
+        named_score = 0
+        for (inst_id, inst_subid, size), count in histogram.items():
+            params_size = decoder.params_sizes.get((inst_id, inst_subid))
+            if params_size is not None and params_size in (-1, size):
+                score += count
+                if params_size != -1:
+                    fixed_score += count
+                inst = decoder.instructions_set[(inst_id, inst_subid)]
+                if inst.type_name != f"{inst_id:02X}_{inst_subid:04X}":
+                    named_score += count
+            else:
+                score -= count
+        scores.append((score, fixed_score, named_score))
+    best = max(range(len(decoders)), key=lambda i: scores[i])
+    others = [score for i, (score, _, _) in enumerate(scores) if i != best]
+    margin = scores[best][0] - max(others) if len(others) > 0 else None
+    return decoders[best], scores[best][0], margin
+
+
+def get_pac_list(input: Path) -> List[Path]:
+    pac_list: List[Path] = []
+    if input.is_file():
+        pac_list.append(input)
+    else:
+        # pac_list.extend(list(input.glob("**/stagescript.pac")))
+        # pac_list.extend(list(input.glob("**/missionscript.pac")))
+        pac_list.extend(sorted(input.glob("**/*.pac")))
+    return pac_list
+
+
+def get_games(game: Game, detect: bool) -> List[Game]:
+    if not detect:
+        return [game]
+    # The selected game goes first to win the ties of detect_game
+    return [game] + [g for g in Game if g != game]
+
+
+# Decoders of each worker process, built once by init_worker. With more than
+# one game, the game of each PAC file is detected.
+worker_decoders: List[Decoder] = []
+
+
+def init_worker(games: List[Game]):
+    global worker_decoders
+    worker_decoders = [Decoder(g) for g in games]
+
+
+def get_worker_decoder(buffer, report: PacReport = None) -> Decoder:
+    # The game and the detection score are added to the report, if any
+    if len(worker_decoders) == 1:
+        decoder = worker_decoders[0]
+    else:
+        decoder, score, margin = detect_game(buffer, worker_decoders)
+        if report is not None:
+            report.detect_score = score
+            report.detect_margin = margin
+    if report is not None:
+        report.game = decoder.game
+    return decoder
+
+
+def map_pac_list(
+    func: Callable[[Path], Any], pac_list: List[Path], games: List[Game], jobs: int
+) -> Iterator[Any]:
+    if jobs > 1 and len(pac_list) > 1:
+        with ProcessPoolExecutor(
+            jobs, initializer=init_worker, initargs=(games,)
+        ) as executor:
+            yield from executor.map(func, pac_list, chunksize=8)
+    else:
+        init_worker(games)
+        yield from map(func, pac_list)
+
+
+def write_listing(pac_path: Path, resilient: bool = False) -> PacReport:
+    # In resilient mode errors are reported instead of raised
+    report = PacReport(path=pac_path.as_posix())
+    output = pac_path.parent.joinpath(f"{pac_path.stem}.txt")
+    try:
+        data = pac_path.read_bytes()
+        decoder = get_worker_decoder(data, report)
+        instructions = decoder.decode(data, report.issues, resilient)
+        if not resilient:
+            for issue in report.issues:
+                print(f"{issue.offset:08X} {issue.message}")
+        # print_new_types(instructions)
+        # exit()
+
+        with open(output, "w", encoding="utf-8") as outfile:
+            outfile.writelines(decoder.iter_listing(instructions))
+
+        print_new_types(instructions)
+    except DecodeError as e:
+        if not resilient:
+            raise DecodeError(f'"{pac_path}" {e}') from e
+        report.error = str(e)
+    except Exception as e:
+        if not resilient:
+            raise
+        report.error = f"{type(e).__name__}: {e}"
+    return report
+
+
+def decode_file(
+    pac_path: Path, resilient: bool = False
+) -> Tuple[PacReport, List[Union[Instruction, Tuple[int, bytearray]]]]:
+    # In resilient mode errors are reported instead of raised
+    report = PacReport(path=pac_path.as_posix())
+    instructions: List[Union[Instruction, Tuple[int, bytearray]]] = []
+    try:
+        data = pac_path.read_bytes()
+        decoder = get_worker_decoder(data, report)
+        instructions = decoder.decode(data, report.issues, resilient)
+    except DecodeError as e:
+        if not resilient:
+            raise DecodeError(f'"{pac_path}" {e}') from e
+        report.error = str(e)
+    except Exception as e:
+        if not resilient:
+            raise
+        report.error = f"{type(e).__name__}: {e}"
+    return report, instructions
+
+
+def extract_strings(
+    pac_path: Path, resilient: bool = False
+) -> Tuple[PacReport, List[Tuple[int, Union[bytes, str]]]]:
+    # Returns the (offset, bytes) regions that may be string tables and the
+    # (offset, text) STR params. The regions are classified by the caller,
+    # once per unique byte sequence. In resilient mode errors are reported
+    # instead of raised.
+    report = PacReport(path=pac_path.as_posix())
+    groups: List[Tuple[int, Union[bytes, str]]] = []
+    try:
+        data = pac_path.read_bytes()
+        decoder = get_worker_decoder(data, report)
+        instructions = decoder.iter_decode(data, report.issues, resilient)
+        for i, inst in enumerate(instructions):
+            if isinstance(inst, Tuple):
+                if i == 0:
+                    continue
+                groups.append((inst[0], bytes(inst[1])))
+            else:
+                for p in inst.params:
+                    if p.type == InstType.STR and p.value:
+                        groups.append((p.offset, p.value))
+    except DecodeError as e:
+        if not resilient:
+            raise DecodeError(f'"{pac_path}" {e}') from e
+        report.error = str(e)
+        groups = []
+    except Exception as e:
+        if not resilient:
+            raise
+        report.error = f"{type(e).__name__}: {e}"
+        groups = []
+    return report, groups
+
+
+def analyze_variables(
+    pac_path: Path,
+) -> Tuple[PacReport, Dict[str, Dict[int, Counter]]]:
+    # Reads and writes of each variable slot, by kind (see VARIABLE_KINDS).
+    # Malformed instructions are skipped, and the errors of the PAC file are
+    # reported.
+    report = PacReport(path=pac_path.as_posix())
+    usage: Dict[str, Dict[int, Counter]] = {}
+    try:
+        data = pac_path.read_bytes()
+        decoder = get_worker_decoder(data, report)
+        for inst in decoder.iter_decode(data, report.issues, resilient=True):
+            if isinstance(inst, Tuple):
+                continue
+            for t_position, v_position, access in decoder.operands.get(
+                (inst.type_id, inst.type_subid), []
+            ):
+                kind = VARIABLE_KINDS.get(
+                    unpack_from("I", data, inst.offset + t_position)[0]
+                )
+                if kind is None:
+                    continue
+                # The value is the slot, even if the decoder read it as a float
+                slot = unpack_from("I", data, inst.offset + v_position)[0]
+                usage.setdefault(kind, {}).setdefault(slot, Counter()).update(access)
+    except DecodeError as e:
+        report.error = str(e)
+        usage = {}
+    except Exception as e:
+        report.error = f"{type(e).__name__}: {e}"
+        usage = {}
+    return report, usage
+
+
+def get_stats(pac_path: Path) -> PacStats:
+    # Malformed instructions are counted as raw bytes, and the errors of the
+    # PAC file are reported
+    stats = PacStats(path=pac_path.as_posix())
+    try:
+        data = pac_path.read_bytes()
+        decoder = get_worker_decoder(data)
+        stats.game = decoder.game
+        stats.size = len(data)
+        issues: List[DecodeIssue] = []
+        instructions = decoder.decode(data, issues, resilient=True)
+        stats.issues = len(issues)
+        offsets = [
+            inst[0] if isinstance(inst, Tuple) else inst.offset for inst in instructions
+        ]
+        offsets.append(len(data))
+        for i, inst in enumerate(instructions):
+            size = offsets[i + 1] - offsets[i]
+            if isinstance(inst, Tuple):
+                # Same region types as the listing, the first one is the header
+                regions = classify_region(inst[1]) if i != 0 else []
+                if is_string_table(regions):
+                    stats.string_table_bytes += size
+                elif any(
+                    # Any 4-aligned bytes that aren't text are a JUMP_TABLE in
+                    # the listing, only offsets inside the file are counted here
+                    region_type == RegionType.JUMP_TABLE
+                    and all(o <= len(data) for o in value)
+                    for region_type, value in regions
+                ):
+                    stats.jump_table_bytes += size
+                else:
+                    stats.raw_bytes += size
+                continue
+            opcode = (inst.type_id, inst.type_subid)
+            if opcode in decoder.instructions_set:
+                stats.known_bytes += size
+            else:
+                stats.unknown_bytes += size
+            stats.opcodes.setdefault(opcode, Counter())[size - 4] += 1
+    except DecodeError as e:
+        stats.error = str(e)
+    except Exception as e:
+        stats.error = f"{type(e).__name__}: {e}"
+    return stats
+
+
+def get_string_table(region_bytes: bytes) -> List[Tuple[int, str]]:
+    # (offset in the region, text) of the strings of a STRING_TABLE region,
+    # empty for the other regions
+    regions = classify_region(region_bytes)
+    if not is_string_table(regions):
+        return []
+    table: List[Tuple[int, str]] = []
+    offset = 0
+    # The NUL separators are single bytes in shift_jis, so the texts match
+    # the byte sequences
+    for text_bytes, text in zip(
+        region_bytes.rstrip(b"\x00").split(b"\x00"), regions[0][1]
+    ):
+        if text != "":
+            table.append((offset, text))
+        offset += len(text_bytes) + 1
+    return table
+
+
+def add_strings(
+    strings: Dict[str, StringEntry],
+    string_tables: Dict[bytes, List[Tuple[int, str]]],
+    path: str,
+    groups: List[Tuple[int, Union[bytes, str]]],
+):
+    # string_tables are the regions already classified, shared by all the PAC
+    # files
+    for offset, value in groups:
+        if isinstance(value, str):
+            texts = [(0, value)]
+        else:
+            if value not in string_tables:
+                string_tables[value] = get_string_table(value)
+            texts = string_tables[value]
+        for text_offset, text in texts:
+            if text not in strings:
+                strings[text] = StringEntry(text=text)
+            strings[text].refs.append((path, offset + text_offset))
+
+
+# path:offset of a "#:" PO line, which msgmerge and others join in one line.
+# Paths with spaces are isolated with U+2068/U+2069, as GNU gettext does.
+PO_REFERENCE = re.compile(r"\s*\u2068?(.+?)\u2069?:([0-9A-Fa-f]+)(?=\s|$)")
+
+
+def po_reference(path: str, offset: int) -> str:
+    if re.search(r"\s", path):
+        path = f"\u2068{path}\u2069"
+    return f"{path}:{offset:08X}"
+
+
+def po_escape(text: str) -> str:
+    escapes = {"\\": "\\\\", '"': '\\"', "\n": "\\n", "\t": "\\t"}
+    result = ""
+    for c in text:
+        if c in escapes:
+            result += escapes[c]
+        elif ord(c) < 0x20 or ord(c) == 0x7F:
+            result += f"\\x{ord(c):02x}"
+        else:
+            result += c
+    return result
+
+
+def po_unescape(text: str) -> str:
+    escapes = {"n": "\n", "t": "\t", '"': '"', "\\": "\\"}
+    result = ""
+    i = 0
+    while i < len(text):
+        if text[i : i + 2] == "\\x":
+            result += chr(int(text[i + 2 : i + 4], 16))
+            i += 4
+        elif text[i] == "\\" and i + 1 < len(text):
+            result += escapes.get(text[i + 1], text[i + 1])
+            i += 2
+        else:
+            result += text[i]
+            i += 1
+    return result
+
+
+def write_strings(strings: List[StringEntry], output: Path, format: StringsFormat):
+    with open(output, "w", newline="", encoding="utf-8") as outfile:
+        if format == StringsFormat.PO:
+            outfile.write('msgid ""\nmsgstr ""\n')
+            outfile.write('"Content-Type: text/plain; charset=UTF-8\\n"\n')
+            for entry in strings:
+                outfile.write("\n")
+                for path, offset in entry.refs:
+                    outfile.write(f"#: {po_reference(path, offset)}\n")
+                outfile.write(f'msgid "{po_escape(entry.text)}"\n')
+                outfile.write(f'msgstr "{po_escape(entry.translation)}"\n')
+        else:
+            w = csv.writer(outfile, delimiter=";")
+            w.writerow(["text", "translation", "refs"])
+            for entry in strings:
+                refs = "\n".join(
+                    [f"{path}:{offset:08X}" for path, offset in entry.refs]
+                )
+                w.writerow([entry.text, entry.translation, refs])
+
+
+def read_strings(input: Path) -> List[StringEntry]:
+    strings: List[StringEntry] = []
+    with open(input, newline="", encoding="utf-8") as infile:
+        if input.suffix.lower() == ".csv":
+            r = csv.reader(infile, delimiter=";")
+            next(r)
+            for text_col, translation_col, refs_col in r:
+                entry = StringEntry(text=text_col, translation=translation_col)
+                for ref in refs_col.split("\n"):
+                    path, offset = ref.rsplit(":", 1)
+                    entry.refs.append((path, int(offset, 16)))
+                strings.append(entry)
+        else:
+            entry = StringEntry()
+            field_name = None
+            for line in infile.read().split("\n"):
+                line = line.strip()
+                if line.startswith("#:"):
+                    for path, offset in PO_REFERENCE.findall(line[2:]):
+                        entry.refs.append((path, int(offset, 16)))
+                elif line.startswith("msgid "):
+                    field_name = "text"
+                    entry.text = po_unescape(line[len("msgid ") :][1:-1])
+                elif line.startswith("msgstr "):
+                    field_name = "translation"
+                    entry.translation = po_unescape(line[len("msgstr ") :][1:-1])
+                elif line.startswith('"') and field_name is not None:
+                    value = getattr(entry, field_name) + po_unescape(line[1:-1])
+                    setattr(entry, field_name, value)
+                elif line == "":
+                    if entry.text:  # skip the header
+                        strings.append(entry)
+                    entry = StringEntry()
+                    field_name = None
+            if entry.text:
+                strings.append(entry)
+    return strings
+
+
+# Binary cache of decoded PAC files. After the header, the payload (maybe
+# compressed) has a JSON directory of the columns and the columns, arrays
+# aligned to 8 bytes that are read in place.
+CACHE_MAGIC = b"PACCACHE"
+CACHE_VERSION = 2
+# magic, version, compression, payload size
+CACHE_HEADER = struct.Struct("<8sIB3xQ")
+# Layout of the raw bytes regions
+CACHE_LAYOUT_RAW_BYTES = 0xFFFFFFFF
+CACHE_VALUE_NONE = 0
+CACHE_VALUE_UINT = 1
+CACHE_VALUE_INT = 2
+CACHE_VALUE_FLOAT = 3
+CACHE_VALUE_STR = 4
+CACHE_VALUE_BYTES = 5
+# V_ params whose type and value kind come from their T_ param
+CACHE_VALUE_V = 6
+# T_ values of the float V_ params, as in Decoder.iter_decode
+CACHE_FLOAT_T_VALUES = (0x10, 0x20, 0x40)
+CACHE_COLUMNS = {
+    # PAC files
+    "files_path": "I",
+    "files_game": "B",
+    "files_first_item": "I",
+    "files_items": "I",
+    "files_first_param": "I",
+    # Opcodes, as found in the instructions (unk_ included)
+    "opcodes_type_id": "B",
+    "opcodes_type_subid": "H",
+    "opcodes_type_name": "I",
+    "opcodes_desc": "I",
+    # Param definitions (name, type, type_str, value_index, value kind),
+    # strings are indexes of the strings pool and -1 is None
+    "schemas_name": "i",
+    "schemas_type": "I",
+    "schemas_type_str": "i",
+    "schemas_value_index": "h",
+    "schemas_value_kind": "B",
+    # Opcode and param definitions of the instructions, the schema of a param
+    # is layouts_schemas[layouts_first + position]. The same opcode has more
+    # than one layout when its params depend on the values (T_/V_, COUNT_).
+    "layouts_opcode": "I",
+    "layouts_first": "I",
+    "layouts_count": "I",
+    "layouts_schemas": "I",
+    # Instructions and raw bytes regions
+    "items_offset": "I",
+    "items_layout": "I",
+    # Params of the items in order, one 32-bit word each like in the PAC file:
+    # an int, the bits of a float, or the index of a STR or of the bytes of a
+    # BYTES param. A raw bytes region has one param, the index of its bytes.
+    "params_value": "I",
+    "strs_text": "I",
+    "strs_offset": "I",
+    # Raw bytes regions and BYTES params in the blob
+    "bytes_offset": "I",
+    "bytes_size": "I",
+    # Strings pool: UTF-8 strings, string i is strings[offsets[i]:offsets[i + 1]]
+    "strings_offsets": "Q",
+    "strings": "B",
+    # Raw bytes of the regions and BYTES params
+    "blob": "B",
+}
+
+
+class CacheWriter:
+    # Columns of the decoded PAC files, written by write
+
+    def __init__(self):
+        self.columns: Dict[str, array] = {
+            name: array(typecode) for name, typecode in CACHE_COLUMNS.items()
+        }
+        self.columns["strings_offsets"].append(0)
+        self.strings: Dict[str, int] = {}
+        self.opcodes: Dict[Tuple[int, int, str, str], int] = {}
+        self.schemas: Dict[Tuple[str, int, str, int, int], int] = {}
+        self.layouts: Dict[Tuple[int, Tuple[int, ...]], int] = {}
+
+    def add_string(self, text: str) -> int:
+        if text is None:
+            return -1
+        if text not in self.strings:
+            self.strings[text] = len(self.strings)
+            self.columns["strings"].frombytes(text.encode("utf-8"))
+            self.columns["strings_offsets"].append(len(self.columns["strings"]))
+        return self.strings[text]
+
+    def add_bytes(self, data: bytes) -> int:
+        c = self.columns
+        c["bytes_offset"].append(len(c["blob"]))
+        c["bytes_size"].append(len(data))
+        c["blob"].frombytes(data)
+        return len(c["bytes_offset"]) - 1
+
+    def add_param(self, param: InstParam, t_value: int = None) -> int:
+        # Adds the value of the param and returns its schema. t_value is the
+        # value of the T_ param of a V_ param.
+        c = self.columns
+        value_type = param.type
+        if param.value is None:
+            value_kind, value = CACHE_VALUE_NONE, 0
+        elif isinstance(param.value, str):
+            value_kind, value = CACHE_VALUE_STR, len(c["strs_text"])
+            c["strs_text"].append(self.add_string(param.value))
+            c["strs_offset"].append(param.offset)
+        elif isinstance(param.value, float):
+            # The decoder rounds the floats to 4 decimals, rounding again the
+            # float32 gives back the same value
+            value_kind = CACHE_VALUE_FLOAT
+            value = unpack("I", struct.pack("f", param.value))[0]
+        elif isinstance(param.value, (bytes, bytearray)):
+            value_kind, value = CACHE_VALUE_BYTES, self.add_bytes(param.value)
+        elif InstType.INT in param.type and not (
+            InstType.UINT in param.type or InstType.COUNT in param.type
+        ):
+            # Read as signed by the decoder
+            value_kind, value = CACHE_VALUE_INT, param.value & 0xFFFFFFFF
+        else:
+            value_kind, value = CACHE_VALUE_UINT, param.value
+        if InstType.V in param.type and t_value is not None:
+            # Stored with the type of the instruction set, like that a V_ param
+            # has the same schema whatever the T_ value
+            base_type = param.type & ~(InstType.FLOAT | InstType.INT)
+            if t_value in CACHE_FLOAT_T_VALUES:
+                t_type, t_value_kind = InstType.FLOAT, CACHE_VALUE_FLOAT
+            else:
+                t_type, t_value_kind = InstType.INT, CACHE_VALUE_INT
+            if param.type == base_type | t_type and value_kind == t_value_kind:
+                value_kind, value_type = CACHE_VALUE_V, base_type
+        c["params_value"].append(value)
+        value_index = -1 if param.value_index is None else param.value_index
+        key = (param.name, value_type.value, param.type_str, value_index, value_kind)
+        if key not in self.schemas:
+            self.schemas[key] = len(self.schemas)
+            c["schemas_name"].append(self.add_string(param.name))
+            c["schemas_type"].append(value_type.value)
+            c["schemas_type_str"].append(self.add_string(param.type_str))
+            c["schemas_value_index"].append(value_index)
+            c["schemas_value_kind"].append(value_kind)
+        return self.schemas[key]
+
+    def add_layout(self, opcode: int, schemas: Tuple[int, ...]) -> int:
+        c = self.columns
+        key = (opcode, schemas)
+        if key not in self.layouts:
+            self.layouts[key] = len(self.layouts)
+            c["layouts_opcode"].append(opcode)
+            c["layouts_first"].append(len(c["layouts_schemas"]))
+            c["layouts_count"].append(len(schemas))
+            c["layouts_schemas"].extend(schemas)
+        return self.layouts[key]
+
+    def add(
+        self,
+        path: str,
+        game: Game,
+        instructions: Iterable[Union[Instruction, Tuple[int, bytearray]]],
+    ):
+        c = self.columns
+        c["files_path"].append(self.add_string(path))
+        c["files_game"].append(list(Game).index(game))
+        c["files_first_item"].append(len(c["items_offset"]))
+        c["files_first_param"].append(len(c["params_value"]))
+        for inst in instructions:
+            if isinstance(inst, Tuple):
+                offset, region_bytes = inst
+                c["items_offset"].append(offset)
+                c["items_layout"].append(CACHE_LAYOUT_RAW_BYTES)
+                c["params_value"].append(self.add_bytes(region_bytes))
+                continue
+            key = (inst.type_id, inst.type_subid, inst.type_name, inst.desc)
+            if key not in self.opcodes:
+                self.opcodes[key] = len(self.opcodes)
+                c["opcodes_type_id"].append(inst.type_id)
+                c["opcodes_type_subid"].append(inst.type_subid)
+                c["opcodes_type_name"].append(self.add_string(inst.type_name))
+                c["opcodes_desc"].append(self.add_string(inst.desc))
+            c["items_offset"].append(inst.offset)
+            t_values: Dict[int, int] = {}
+            for param in inst.params:
+                if param.value_index is not None:
+                    # None if the V_ param has more than one T_ param
+                    t_values[param.value_index] = (
+                        None if param.value_index in t_values else param.value
+                    )
+            schemas = tuple(
+                [
+                    self.add_param(param, t_values.get(i))
+                    for i, param in enumerate(inst.params)
+                ]
+            )
+            c["items_layout"].append(self.add_layout(self.opcodes[key], schemas))
+        c["files_items"].append(len(c["items_offset"]) - c["files_first_item"][-1])
+
+    def write(self, output: Path, compression: Compression = Compression.NONE):
+        directory: Dict[str, Tuple[int, int]] = {}
+        sections: List[bytes] = []
+        offset = 0
+        for name, column in self.columns.items():
+            if sys.byteorder == "big":
+                column = array(column.typecode, column)
+                column.byteswap()
+            data = column.tobytes()
+            data += b"\x00" * (-len(data) % 8)
+            directory[name] = (offset, len(column))
+            sections.append(data)
+            offset += len(data)
+        directory_bytes = json.dumps(directory).encode("utf-8")
+        directory_bytes += b" " * (-(len(directory_bytes) + 8) % 8)
+        payload = b"".join(
+            [struct.pack("<Q", len(directory_bytes)), directory_bytes] + sections
+        )
+        size = len(payload)
+        if compression == Compression.LZMA:
+            payload = lzma.compress(payload)
+        elif compression == Compression.ZSTD:
+            if zstandard is None:
+                raise ValueError("zstd compression needs the zstandard package")
+            payload = zstandard.ZstdCompressor().compress(payload)
+        compression_id = list(Compression).index(compression)
+        with open(output, "wb") as outfile:
+            outfile.write(
+                CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, compression_id, size)
+            )
+            outfile.write(payload)
+
+
+class PacCache:
+    # Reader of the files written by CacheWriter. Uncompressed caches are
+    # memory-mapped, and the records are only built when they are read.
+
+    def __init__(self, path: Path):
+        self.mmap = None
+        with open(path, "rb") as infile:
+            self.mmap = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, compression_id, size = CACHE_HEADER.unpack_from(self.mmap)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            self.close()
+            raise ValueError(f'"{path}" is not a PAC cache (version {CACHE_VERSION})')
+        compression = list(Compression)[compression_id]
+        if compression == Compression.NONE:
+            payload = memoryview(self.mmap)[CACHE_HEADER.size :]
+        else:
+            compressed = self.mmap[CACHE_HEADER.size :]
+            self.close()
+            if compression == Compression.LZMA:
+                payload = memoryview(lzma.decompress(compressed))
+            elif zstandard is None:
+                raise ValueError("zstd compression needs the zstandard package")
+            else:
+                payload = memoryview(
+                    zstandard.ZstdDecompressor().decompress(compressed, size)
+                )
+        directory_size = unpack_from("<Q", payload)[0]
+        directory = json.loads(bytes(payload[8 : 8 + directory_size]))
+        sections = payload[8 + directory_size :]
+        self.columns: Dict[str, memoryview] = {}
+        for name, (offset, length) in directory.items():
+            typecode = CACHE_COLUMNS[name]
+            column = sections[offset : offset + length * array(typecode).itemsize]
+            if sys.byteorder == "big":
+                column = array(typecode, column.tobytes())
+                column.byteswap()
+                column = memoryview(column)
+            self.columns[name] = column.cast(typecode)
+        self.strings: Dict[int, str] = {}
+        self.paths: List[str] = [self.get_string(i) for i in self.columns["files_path"]]
+        self.files: Dict[str, int] = {path: i for i, path in enumerate(self.paths)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        # The views of the mmap have to be released before closing it
+        for column in getattr(self, "columns", {}).values():
+            column.release()
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+
+    def get_string(self, index: int) -> str:
+        if index == -1:
+            return None
+        if index not in self.strings:
+            offsets = self.columns["strings_offsets"]
+            self.strings[index] = bytes(
+                self.columns["strings"][offsets[index] : offsets[index + 1]]
+            ).decode("utf-8")
+        return self.strings[index]
+
+    def get_bytes(self, index: int) -> bytearray:
+        offset = self.columns["bytes_offset"][index]
+        return bytearray(
+            self.columns["blob"][offset : offset + self.columns["bytes_size"][index]]
+        )
+
+    def get_game(self, path: str) -> Game:
+        return list(Game)[self.columns["files_game"][self.files[path]]]
+
+    def get_value(self, value_kind: int, value: int) -> Any:
+        if value_kind == CACHE_VALUE_NONE:
+            return None
+        elif value_kind == CACHE_VALUE_INT and value >= 0x80000000:
+            return value - 0x100000000
+        elif value_kind == CACHE_VALUE_FLOAT:
+            float_value = unpack("f", struct.pack("I", value))[0]
+            return float("{:.4f}".format(float_value))
+        elif value_kind == CACHE_VALUE_STR:
+            return self.get_string(self.columns["strs_text"][value])
+        elif value_kind == CACHE_VALUE_BYTES:
+            return self.get_bytes(value)
+        return value
+
+    def get_param(self, index: int, schema: int) -> InstParam:
+        # The value of a CACHE_VALUE_V param is left as is for iter_decode
+        c = self.columns
+        value_kind = c["schemas_value_kind"][schema]
+        value = c["params_value"][index]
+        offset = c["strs_offset"][value] if value_kind == CACHE_VALUE_STR else None
+        value_index = c["schemas_value_index"][schema]
+        return InstParam(
+            name=self.get_string(c["schemas_name"][schema]),
+            type=InstType(c["schemas_type"][schema]),
+            type_str=self.get_string(c["schemas_type_str"][schema]),
+            value=self.get_value(value_kind, value),
+            offset=offset,
+            value_index=None if value_index == -1 else value_index,
+        )
+
+    def iter_decode(
+        self, path: str
+    ) -> Iterator[Union[Instruction, Tuple[int, bytearray]]]:
+        # Same items as Decoder.iter_decode for the PAC file
+        c = self.columns
+        first_item = c["files_first_item"][self.files[path]]
+        first = c["files_first_param"][self.files[path]]
+        for i in range(first_item, first_item + c["files_items"][self.files[path]]):
+            layout = c["items_layout"][i]
+            if layout == CACHE_LAYOUT_RAW_BYTES:
+                yield (c["items_offset"][i], self.get_bytes(c["params_value"][first]))
+                first += 1
+                continue
+            opcode = c["layouts_opcode"][layout]
+            schemas = c["layouts_schemas"][
+                c["layouts_first"][layout] : c["layouts_first"][layout]
+                + c["layouts_count"][layout]
+            ]
+            params = [
+                self.get_param(first + j, schema) for j, schema in enumerate(schemas)
+            ]
+            for param in params:
+                if param.value_index is None or param.value_index >= len(params):
+                    continue
+                value_kind = c["schemas_value_kind"][schemas[param.value_index]]
+                if value_kind != CACHE_VALUE_V:
+                    continue
+                v_param = params[param.value_index]
+                if param.value in CACHE_FLOAT_T_VALUES:
+                    v_param.type |= InstType.FLOAT
+                    v_param.value = self.get_value(CACHE_VALUE_FLOAT, v_param.value)
+                else:
+                    v_param.type |= InstType.INT
+                    v_param.value = self.get_value(CACHE_VALUE_INT, v_param.value)
+            yield Instruction(
+                type_id=c["opcodes_type_id"][opcode],
+                type_subid=c["opcodes_type_subid"][opcode],
+                type_name=self.get_string(c["opcodes_type_name"][opcode]),
+                desc=self.get_string(c["opcodes_desc"][opcode]),
+                params=params,
+                offset=c["items_offset"][i],
+            )
+            first += len(schemas)
+
+    def decode(self, path: str) -> List[Union[Instruction, Tuple[int, bytearray]]]:
+        return list(self.iter_decode(path))
+
+
 app = typer.Typer()
 
 
@@ -304,7 +1744,20 @@ def pac(
     game: Game = typer.Option(
         Game.P3, show_default="P3", case_sensitive=False, help="Patapon game"
     ),
+    detect: bool = typer.Option(
+        False, help="Detect the game of each PAC file, --game breaks the ties"
+    ),
     # output: Path = typer.Option(None, "--output", "-o", help="TXT file path"),
+    jobs: int = typer.Option(
+        os.cpu_count(), "--jobs", "-j", show_default="CPU count", help="Processes"
+    ),
+    resilient: bool = typer.Option(
+        False, help="Keep malformed instructions as RAW_BYTES and skip broken files"
+    ),
+    manifest: Path = typer.Option(
+        None, help="JSON lines report of the decoded PAC files and their errors"
+    ),
+    resume: bool = typer.Option(False, help="Skip the PAC files already in --manifest"),
 ):
     print(f"{text2art('PAC Viewer', font='tarty2').rstrip()} by efonte\n")
     # if not input.is_file():
@@ -312,476 +1765,432 @@ def pac(
     #     exit(1)
     # if not output:
     #     output = input.parent.joinpath(f"{input.stem}.txt")
-    pac_list: List[Path] = []
-    if input.is_file():
-        pac_list.append(input)
-    else:
-        # pac_list.extend(list(input.glob("**/stagescript.pac")))
-        # pac_list.extend(list(input.glob("**/missionscript.pac")))
-        pac_list.extend(list(input.glob("**/*.pac")))
+    pac_list = get_pac_list(input)
+    games = get_games(game, detect)
 
-    instructions_set = get_instruction_set(f"{game.value.lower()}_instruction_set.csv")
-    keybinds = get_ids(Path("./keybinds.csv"))
-    loot = get_ids(Path(f"./{game.value.lower()}_loot.csv"))
+    if manifest and resume and manifest.is_file():
+        done = set()
+        with open(manifest, encoding="utf-8") as manifest_file:
+            for line in manifest_file:
+                # The last line is incomplete if the batch was killed
+                try:
+                    done.add(json.loads(line)["path"])
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    pass
+        print(f"Resuming, skipping {len(done)} PAC files")
+        pac_list = [p for p in pac_list if p.as_posix() not in done]
 
+    detected = Counter()
+    num_issues = 0
+    num_errors = 0
     console = Console()
+    with console.status(f"Processing {len(pac_list)} PAC files"), open(
+        manifest or os.devnull, "a" if resume else "w", encoding="utf-8"
+    ) as manifest_file:
+        if resume and manifest and manifest.read_bytes()[-1:] not in (b"", b"\n"):
+            # New lines start after the incomplete one
+            manifest_file.write("\n")
+        try:
+            for report in map_pac_list(
+                partial(write_listing, resilient=resilient), pac_list, games, jobs
+            ):
+                detected[report.game] += 1
+                if report.detect_margin == 0:
+                    print(
+                        f'Ambiguous game "{report.path}": {report.game.value} '
+                        f"(score {report.detect_score}, margin 0)"
+                    )
+                num_issues += len(report.issues)
+                if report.error:
+                    num_errors += 1
+                    print(f'Error "{report.path}": {report.error}')
+                # Written as soon as each file is done, to resume from here
+                manifest_file.write(json.dumps(asdict(report), ensure_ascii=False))
+                manifest_file.write("\n")
+                manifest_file.flush()
+        except DecodeError as e:
+            print(f"Error {e}")
+            raise typer.Exit(1)
+    if detect:
+        print(", ".join([f"{g.value}: {n} PAC files" for g, n in detected.items()]))
+    if resilient:
+        print(f"{num_issues} issues, {num_errors} PAC files with errors")
 
-    for input in pac_list:
-        output = input.parent.joinpath(f"{input.stem}.txt")
-        # print(f'Reading "{input}"')
-        infile = open(input, "rb")
-        # outfile = open(output, "w", encoding="utf-8")
-        last_offset = get_last_offset(infile)
 
-        instructions: List[Union[Instruction, Tuple[int, bytearray]]] = []
+@app.command()
+def strings(
+    input: Path = typer.Argument(..., help="PAC file or folder path"),
+    game: Game = typer.Option(
+        Game.P3, show_default="P3", case_sensitive=False, help="Patapon game"
+    ),
+    detect: bool = typer.Option(
+        False, help="Detect the game of each PAC file, --game breaks the ties"
+    ),
+    format: StringsFormat = typer.Option(
+        StringsFormat.PO, case_sensitive=False, help="Output format"
+    ),
+    output: Path = typer.Option(None, "--output", "-o", help="PO/CSV file path"),
+    jobs: int = typer.Option(
+        os.cpu_count(), "--jobs", "-j", show_default="CPU count", help="Processes"
+    ),
+    resilient: bool = typer.Option(
+        False, help="Keep malformed instructions as RAW_BYTES and skip broken files"
+    ),
+):
+    print(f"{text2art('PAC Viewer', font='tarty2').rstrip()} by efonte\n")
+    if not output:
+        output = Path(f"strings.{format.value}")
+    pac_list = get_pac_list(input)
+    root = input if input.is_dir() else input.parent
+    games = get_games(game, detect)
 
-        with console.status(f'Processing "{input}"'):
-            while infile.tell() < last_offset:
-                offset = infile.tell()
-                raw_bytes = get_inst_raw_bytes(infile, last_offset)
-                # exit()
-                # raw_bytes_str = " ".join([f"{b:02X}" for b in raw_bytes])
-                params_bytes = raw_bytes[4:]
-                params_io = BytesIO(params_bytes)
-                inst_magic, inst_id, inst_subid = unpack("BBH", raw_bytes[0:4])
-                # print (len(params_bytes))
-                # exit()
-                if inst_magic != 0x25:
-                    if len(instructions) > 0 and isinstance(instructions[-1], Tuple):
-                        instructions[-1][1].extend(raw_bytes)
-                    else:
-                        instructions.append((offset, raw_bytes))
-                else:
-                    inst = Instruction(
-                        type_id=inst_id,
-                        type_subid=inst_subid,
-                        type_name=f"unk_{inst_id:02X}_{inst_subid:04X}",
-                        desc="Unk",
-                        # size_bytes_params=-1,
-                        params=[
-                            InstParam(name=None, type=InstType.BYTES, type_str="bytes")
-                        ],
+    # Unique strings and regions shared by all the PAC files
+    strings: Dict[str, StringEntry] = {}
+    string_tables: Dict[bytes, List[Tuple[int, str]]] = {}
+
+    num_issues = 0
+    num_errors = 0
+    console = Console()
+    with console.status(f"Extracting strings from {len(pac_list)} PAC files"):
+        try:
+            results = map_pac_list(
+                partial(extract_strings, resilient=resilient), pac_list, games, jobs
+            )
+            for pac_path, (report, groups) in zip(pac_list, results):
+                num_issues += len(report.issues)
+                if report.error:
+                    num_errors += 1
+                    print(f'Error "{report.path}": {report.error}')
+                path = pac_path.relative_to(root).as_posix()
+                add_strings(strings, string_tables, path, groups)
+        except DecodeError as e:
+            print(f"Error {e}")
+            raise typer.Exit(1)
+
+    entries = list(strings.values())
+    write_strings(entries, output, format)
+    num_refs = sum([len(e.refs) for e in entries])
+    print(
+        f'{len(entries)} unique strings ({num_refs} occurrences) written to "{output}"'
+    )
+    if resilient:
+        print(f"{num_issues} issues, {num_errors} PAC files with errors")
+
+
+@app.command()
+def variables(
+    input: Path = typer.Argument(..., help="PAC file or folder path"),
+    game: Game = typer.Option(
+        Game.P3, show_default="P3", case_sensitive=False, help="Patapon game"
+    ),
+    detect: bool = typer.Option(
+        False, help="Detect the game of each PAC file, --game breaks the ties"
+    ),
+    output: Path = typer.Option(
+        Path("variables.json"), "--output", "-o", help="JSON file path"
+    ),
+    jobs: int = typer.Option(
+        os.cpu_count(), "--jobs", "-j", show_default="CPU count", help="Processes"
+    ),
+):
+    print(f"{text2art('PAC Viewer', font='tarty2').rstrip()} by efonte\n")
+    pac_list = get_pac_list(input)
+    root = input if input.is_dir() else input.parent
+    games = get_games(game, detect)
+
+    files: Dict[str, Any] = {}
+    # kind -> slot -> reads, writes and PAC files using it
+    total: Dict[str, Dict[int, Dict[str, Any]]] = {}
+
+    num_errors = 0
+    console = Console()
+    with console.status(f"Analyzing {len(pac_list)} PAC files"):
+        results = map_pac_list(analyze_variables, pac_list, games, jobs)
+        for pac_path, (report, usage) in zip(pac_list, results):
+            if report.error:
+                num_errors += 1
+                print(f'Error "{report.path}": {report.error}')
+                continue
+            path = pac_path.relative_to(root).as_posix()
+            file_usage: Dict[str, Dict[int, Dict[str, int]]] = {}
+            for kind, slots in sorted(usage.items()):
+                file_usage[kind] = {}
+                for slot, counts in sorted(slots.items()):
+                    file_usage[kind][slot] = {a: counts[a] for a in VARIABLE_ACCESSES}
+                    slot_total = total.setdefault(kind, {}).setdefault(
+                        slot, {**{a: 0 for a in VARIABLE_ACCESSES}, "files": []}
                     )
-                    for i in instructions_set:
-                        if i.type_id == inst_id and i.type_subid == inst_subid:
-                            # inst = i
-                            inst = copy.deepcopy(i)
-                    inst.offset = offset
-                    # if inst_magic != 0x25 and infile.tell() < last_offset:
-                    # outfile.write(f"{offset:08X} {raw_bytes_io}\n")
-                    # raw_bytes_parsed = 0
-                    # while raw_bytes_parsed <len(params_bytes):
-                    # if len(inst.params) == 1 and inst.params[0].type == InstType.BYTES:
-                    # inst.params[0].value = params_bytes
-                    # print (f"{offset:08X}")
-
-                    try:
-
-                        for i in range(len(inst.params)):
-                            param: InstParam = inst.params[i]
-                            if param.type == InstType.BYTES:
-                                param.value = params_bytes
-                            elif param.type == InstType.STR:
-                                # # text = params_io.read(4)
-                                # text = unpack("4s", params_io.read(4))[0].decode("shift_jis")
-                                # while text[-1] != "\x00":
-                                #     text += unpack("4s", params_io.read(4))[0].decode("shift_jis")
-                                params_last_offset = get_last_offset(params_io)
-                                text_bytes = params_io.read(1)
-                                while (
-                                    text_bytes[-1] != 0x00
-                                    and params_io.tell() < params_last_offset
-                                ):
-                                    text_bytes += params_io.read(1)
-                                    # print(f"{infile.tell():08X}")
-                                    # print(text_bytes[-1])
-                                # text = unpack(f"{len(text_bytes)}s", bytearray(text_bytes))[0].decode("cp932").rstrip("\x00")
-                                text = (
-                                    unpack(
-                                        f"{len(text_bytes)}s", bytearray(text_bytes)
-                                    )[0]
-                                    .decode("shift_jis")
-                                    .rstrip("\x00")
-                                )
-                                # if (
-                                #     i == len(inst.params) - 1
-                                # ):  # read variables if str is the last parameter
-                                #     text_variables = params_io.read()
-                                #     # if len(text_variables) > 0:
-                                #     #     if len(text_variables) >= 4:
-                                #     #         text += "{"
-                                #     #         chunks = [
-                                #     #             text_variables[i : i + 4]
-                                #     #             for i in range(0, len(text_variables), 4)
-                                #     #         ]
-                                #     #         chunk_count = 0
-                                #     #         for chunk in chunks:
-                                #     #             if len(chunk) == 4:
-                                #     #                 # if chunk != b"\x00" * 4:
-                                #     #                 # text += " ".join([f"{b:02X}" for b in chunk])
-                                #     #                 text += " " if chunk_count > 0 else ""
-                                #     #                 text += f"{unpack(f'I', chunk)[0]:08X}"
-                                #     #                 chunk_count += 1
-                                #     #             elif chunk != b"\x00" * len(chunk):
-                                #     #                 print("Error 1. Expecting padding")
-                                #     #                 exit()
-                                #     #         text += "}"
-                                #     #         # text += (
-                                #     #         #     "{" + " ".join([f"{b:02X}" for b in text_variables]) + "}"
-                                #     #         # )
-                                #     #     elif text_variables != b"\x00" * len(text_variables):
-                                #     #         print("Error 2. Expecting padding")
-                                #     #         exit()
-                                #     chunks = [
-                                #         text_variables[i : i + 4]
-                                #         for i in range(0, len(text_variables), 4)
-                                #     ]
-                                #     if (
-                                #         len(chunks) > 0
-                                #         and len(chunks[-1]) < 4
-                                #         and chunks[-1] == b"\x00" * len(chunks[-1])
-                                #     ):
-                                #         chunks = chunks[0:-1]
-                                #     if len(chunks) > 0:
-                                #         text += (
-                                #             "{"
-                                #             + " ".join(
-                                #                 [f"{b:02X}" for b in b"".join(chunks)]
-                                #             )
-                                #             + "}"
-                                #         )
-                                # else:
-                                #     # Read padding
-                                #     if params_io.tell() % 4 != 0:
-                                #         padding_size = (
-                                #             (params_io.tell() // 4) + 1
-                                #         ) * 4 - params_io.tell()
-                                #         padding = params_io.read(padding_size)
-                                #         if padding != b"\x00" * len(padding):
-                                #             print(
-                                #                 f"Error. Expecting padding. Found {padding}"
-                                #             )
-                                #             # exit()
-
-                                param.value = text
-                                # break
-                            elif param.type == InstType.T:
-                                param.value = unpack(f"I", params_io.read(4))[0]
-                                value_type_str = "V_" + param.type_str.split("T_")[1]
-
-                                # eg: V_2_KEYBIND_ID
-                                value_index = next(
-                                    (
-                                        i_el
-                                        for i_el, el in enumerate(inst.params)
-                                        if el.type_str.startswith(value_type_str + "_")
-                                    ),
-                                    None,
-                                )
-                                # eg: V_2
-                                if value_index is None:
-                                    value_index = next(
-                                        (
-                                            i_el
-                                            for i_el, el in enumerate(inst.params)
-                                            if el.type_str == value_type_str
-                                        ),
-                                        None,
-                                    )
+                    for a in VARIABLE_ACCESSES:
+                        slot_total[a] += counts[a]
+                    slot_total["files"].append(path)
+            files[path] = {"game": report.game, "variables": file_usage}
 
-                                # If V_2_KEYBIND_ID or V_2
-                                if value_index is not None:
-                                    # 0x40 - FloatGlobal
-                                    # 0x20 - FloatLocal
-                                    # 0x10 - FloatImm
-                                    # 0x8 - IntGlobal
-                                    # 0x4 - IntLocal
-                                    # 0x2 - IntImm
-                                    # 0x1 - Index
-                                    # 0x0 - None
-                                    if (
-                                        param.value == 0x10
-                                        or param.value == 0x20
-                                        or param.value == 0x40
-                                    ):  # float
-                                        inst.params[value_index].type |= InstType.FLOAT
-                                    elif (
-                                        param.value == 0x1
-                                        or param.value == 0x2
-                                        or param.value == 0x4
-                                        or param.value == 0x8
-                                    ):  # int, short, uint, ushort?
-                                        inst.params[value_index].type |= InstType.INT
-                                    # elif (
-                                    #     param.value == 0x20
-                                    # ):  # int, short, uint, ushort?
-                                    #     inst.params[value_index].type |= InstType.UINT
-                                    else:  # 0x4, 0x8, 0x40
-                                        inst.params[value_index].type |= InstType.INT
-                                        # TODO
-                                        print(
-                                            f"{offset:08X} {inst.type_name} Unknown Type 0x{param.value:X}"
-                                        )
-                                        # exit(1)
-                            elif InstType.CONTINUOUS in param.type:
-                                sub_param_type = InstType.UINT
-                                sub_param_type_str = "UINT"
-                                if InstType.UINT in param.type:
-                                    sub_param_type = InstType.UINT
-                                    sub_param_type_str = "UINT"
-                                elif InstType.INT in param.type:
-                                    sub_param_type = InstType.INT
-                                    sub_param_type_str = "INT"
-                                elif InstType.FLOAT in param.type:
-                                    sub_param_type = InstType.FLOAT
-                                    sub_param_type_str = "FLOAT"
-                                name_var = param.name_var
-                                inst.params.remove(param)
-                                params_last_offset = get_last_offset(params_io)
-                                num_params = (
-                                    params_last_offset - params_io.tell()
-                                ) // 4
-                                for c in range(num_params):
-                                    sub_param = InstParam()
-                                    sub_param.type = sub_param_type
-                                    sub_param.type_str = sub_param_type_str
-                                    # sub_param.name = f"continuous{c+1}"
-                                    sub_param.name = f"{name_var}_{c+1}"
-                                    if sub_param_type == InstType.UINT:
-                                        sub_param.value = unpack(
-                                            f"I", params_io.read(4)
-                                        )[0]
-                                    elif sub_param_type == InstType.INT:
-                                        sub_param.value = unpack(
-                                            f"i", params_io.read(4)
-                                        )[0]
-                                    elif sub_param_type == InstType.FLOAT:
-                                        sub_param.value = float(
-                                            "{:.4f}".format(
-                                                unpack(f"f", params_io.read(4))[0]
-                                            )
-                                        )
-                                    else:
-                                        print(f"Error Continuous unk {sub_param_type=}")
-                                        exit()
-                                    inst.params.append(sub_param)
-                                break
-                            elif InstType.COUNT in param.type:
-                                count = unpack(f"I", params_io.read(4))[0]
-                                param.value = count
-                                sub_param_type = InstType.UINT
-                                sub_param_type_str = "UINT"
-                                if InstType.UINT in param.type:
-                                    sub_param_type = InstType.UINT
-                                    sub_param_type_str = "UINT"
-                                elif InstType.INT in param.type:
-                                    sub_param_type = InstType.INT
-                                    sub_param_type_str = "INT"
-                                elif InstType.FLOAT in param.type:
-                                    sub_param_type = InstType.FLOAT
-                                    sub_param_type_str = "FLOAT"
-                                # inst.params.remove(param)
-                                for c in range(count):
-                                    sub_param = InstParam()
-                                    sub_param.type = sub_param_type
-                                    sub_param.type_str = sub_param_type_str
-                                    # sub_param.name = f"count{c+1}"
-                                    sub_param.name = f"{param.name_var}_{c+1}"
-                                    if sub_param_type == InstType.UINT:
-                                        sub_param.value = unpack(
-                                            f"I", params_io.read(4)
-                                        )[0]
-                                    elif sub_param_type == InstType.INT:
-                                        sub_param.value = unpack(
-                                            f"i", params_io.read(4)
-                                        )[0]
-                                    elif sub_param_type == InstType.FLOAT:
-                                        sub_param.value = float(
-                                            "{:.4f}".format(
-                                                unpack(f"f", params_io.read(4))[0]
-                                            )
-                                        )
-                                    else:
-                                        print(f"Error Count {sub_param_type=}")
-                                        exit()
-                                    inst.params.append(sub_param)
-                                # TODO Check if there are more parameters after the COUNT
-                                break
-                            elif InstType.UINT in param.type:
-                                try:
-                                    param.value = unpack(f"I", params_io.read(4))[0]
-                                except Exception as e:
-                                    # print(e)
-                                    # print(output)
-                                    # print(inst)
-                                    # exit()
-                                    # p2 setSoundGameSkipLabel: the offset arg is optional
-                                    # param.value = -1
-                                    pass
-                            elif InstType.INT in param.type:
-                                param.value = unpack(f"i", params_io.read(4))[0]
-                            elif InstType.FLOAT in param.type:
-                                param.value = float(
-                                    "{:.4f}".format(unpack(f"f", params_io.read(4))[0])
-                                )
-                            elif param.type == InstType.ENTITY_ID:
-                                param.value = unpack(f"I", params_io.read(4))[0]
-                            elif param.type == InstType.EQUIP_ID:
-                                param.value = unpack(f"I", params_io.read(4))[0]
-                            elif param.type == InstType.KEYBIND_ID:
-                                param.value = unpack(f"I", params_io.read(4))[0]
-                            elif param.type == InstType.LOOT_ID:
-                                param.value = unpack(f"I", params_io.read(4))[0]
-                    except struct.error as e:
-                        print(f'Error "{inst.type_name}": {e}')
-                        exit()
-                    # outfile.write(f"{inst.offset:08X}  {inst.type_name}  {inst.params}\n")
-                    instructions.append(inst)
-
-                    bytes_parsed = 0
-                    for param in inst.params:
-                        if param.type == InstType.STR:
-                            bytes_parsed = -1
-                            break
-                        else:
-                            if param.value is not None:
-                                # p2 setSoundGameSkipLabel: the offset arg is optional
-                                bytes_parsed += 4
-                    if bytes_parsed != -1:
-                        if (
-                            len(params_bytes) != bytes_parsed
-                            and not "unk_" in inst.type_name
-                        ):
-                            # print (inst)
-                            # print (len(params_bytes))
-                            # print (bytes_parsed)
-                            # exit()
-                            # offset = inst.offset + 4 + bytes_parsed
-                            # inst = Instruction(
-                            #     type_id=inst_id,
-                            #     type_subid=inst_subid,
-                            #     type_name=f"RAW_BYTES_INST",
-                            #     desc="Unk",
-                            #     offset=offset,
-                            #     params=[
-                            #         InstParam(
-                            #             name=None,
-                            #             type=InstType.BYTES,
-                            #             type_str="bytes",
-                            #             value=params_bytes[bytes_parsed:],
-                            #             # value=params_bytes,
-                            #         )
-                            #     ],
-                            # )
-                            # instructions.append(inst)
-                            # infile.seek(infile.tell() - len(params_bytes) + bytes_parsed)
-                            if len(instructions) > 0 and isinstance(
-                                instructions[-1], Tuple
-                            ):
-                                instructions[-1][1].extend(params_bytes[bytes_parsed:])
-                            else:
-                                instructions.append(
-                                    (
-                                        inst.offset + 4 + bytes_parsed,
-                                        params_bytes[bytes_parsed:],
-                                    )
-                                )
-                    # break
+    total = {kind: dict(sorted(slots.items())) for kind, slots in sorted(total.items())}
+    with open(output, "w", encoding="utf-8") as outfile:
+        json.dump({"files": files, "total": total}, outfile, indent=2)
+    for kind, slots in total.items():
+        print(f"{kind}: {len(slots)} slots")
+    print(f'Variables of {len(files)} PAC files written to "{output}"')
+    if num_errors > 0:
+        print(f"{num_errors} PAC files with errors skipped")
 
-                # raw_bytes.extend(inst_type_bytes)
-        # print_new_types(instructions)
-        # exit()
 
-        with console.status(f'Generating "{output}"'):
-            with open(output, "w", encoding="utf-8") as outfile:
-                for i, inst in enumerate(instructions):
-                    if isinstance(inst, Tuple):
-                        offset = inst[0]
-                        if i != 0:
-                            try:
-                                text = (
-                                    unpack(f"{len(inst[1])}s", bytearray(inst[1]))[0]
-                                    .decode("shift_jis")
-                                    .rstrip("\x00")
-                                ).split("\x00")
-                                outfile.write(f"{offset:08X}  STRING_TABLE {text}\n")
-                                # current_offset = inst[0]
-                                # num_read_bytes = 0
-                                # buffer = BytesIO(bytearray(inst[1]))
-                                # while num_read_bytes < len(inst[1]):
-                                #     text_bytes = b""
-                                #     text_byte = b""
-                                #     while text_byte != b"\x00":
-                                #         text_byte = buffer.read(1)
-                                #         num_read_bytes += 1
-                                #         text_bytes += text_byte
-                                #     text = (
-                                #         unpack(f"{len(text_bytes)}s", text_bytes)[0]
-                                #         .decode("shift_jis")
-                                #         .rstrip("\x00")
-                                #     )
-                                #     outfile.write(
-                                #         f"{current_offset+num_read_bytes-len(text_bytes):08X}  STRING {text}\n"
-                                #     )
-                                try:
-                                    chunks = [
-                                        inst[1][i : i + 4]
-                                        for i in range(0, len(inst[1]), 4)
-                                    ]
-                                    bytes_str = ""
-                                    skip_offsets = False
-                                    for chunk_count, chunk in enumerate(chunks):
-                                        if chunk_count != 0:
-                                            bytes_str += ", "
-                                        offs = unpack("I", chunk)[0]
-                                        if (
-                                            offs > 0xC0000
-                                        ):  # size of p2 unitbase = 0xB8A8C
-                                            skip_offsets = True
-                                            continue
-                                        bytes_str += f"{offs:X}"
-                                    if not skip_offsets:
-                                        outfile.write(
-                                            f"{offset:08X}  JUMP_TABLE {bytes_str}\n"
-                                        )
-                                except Exception:
-                                    bytes_str = " ".join([f"{b:02X}" for b in inst[1]])
-                                    outfile.write(
-                                        f"{offset:08X}  RAW_BYTES {bytes_str}\n"
-                                    )
-                            except UnicodeDecodeError:
-                                try:
-                                    chunks = [
-                                        inst[1][i : i + 4]
-                                        for i in range(0, len(inst[1]), 4)
-                                    ]
-                                    bytes_str = ""
-                                    for chunk_count, chunk in enumerate(chunks):
-                                        if chunk_count != 0:
-                                            bytes_str += ", "
-                                        bytes_str += f"{unpack('I', chunk)[0]:X}"
-                                    outfile.write(
-                                        f"{offset:08X}  JUMP_TABLE {bytes_str}\n"
-                                    )
-                                except Exception:
-                                    bytes_str = " ".join([f"{b:02X}" for b in inst[1]])
-                                    outfile.write(
-                                        f"{offset:08X}  RAW_BYTES {bytes_str}\n"
-                                    )
-                        else:
-                            bytes_str = " ".join([f"{b:02X}" for b in inst[1]])
-                            outfile.write(f"{offset:08X}  RAW_BYTES {bytes_str}\n")
+@app.command()
+def stats(
+    input: Path = typer.Argument(..., help="PAC file or folder path"),
+    game: Game = typer.Option(
+        Game.P3, show_default="P3", case_sensitive=False, help="Patapon game"
+    ),
+    detect: bool = typer.Option(
+        False, help="Detect the game of each PAC file, --game breaks the ties"
+    ),
+    output: Path = typer.Option(
+        Path("stats.json"), "--output", "-o", help="JSON file path"
+    ),
+    top: int = typer.Option(20, help="Most used opcodes shown in the table"),
+    jobs: int = typer.Option(
+        os.cpu_count(), "--jobs", "-j", show_default="CPU count", help="Processes"
+    ),
+):
+    print(f"{text2art('PAC Viewer', font='tarty2').rstrip()} by efonte\n")
+    pac_list = get_pac_list(input)
+    root = input if input.is_dir() else input.parent
+    games = get_games(game, detect)
 
-                    else:
-                        outfile.write(
-                            f"{inst.offset:08X}  {inst.type_name}({get_str_params(inst.params, keybinds, loot)})\n"
-                            # f"{inst.offset:08X}  {inst.type_name}  {inst.params}\n"
-                        )
-                    # if i == 2:
-                    #     # print(inst)
-                    #     exit()
+    files: Dict[str, Any] = {}
+    # game -> PAC files stats added together
+    totals: Dict[Game, PacStats] = {}
 
-        print_new_types(instructions)
+    num_errors = 0
+    console = Console()
+    with console.status(f"Analyzing {len(pac_list)} PAC files"):
+        results = map_pac_list(get_stats, pac_list, games, jobs)
+        for pac_path, pac_stats in zip(pac_list, results):
+            if pac_stats.error:
+                num_errors += 1
+                print(f'Error "{pac_stats.path}": {pac_stats.error}')
+                continue
+            files[pac_path.relative_to(root).as_posix()] = {
+                "game": pac_stats.game,
+                "size": pac_stats.size,
+                "known_bytes": pac_stats.known_bytes,
+                "unknown_bytes": pac_stats.unknown_bytes,
+                "string_table_bytes": pac_stats.string_table_bytes,
+                "jump_table_bytes": pac_stats.jump_table_bytes,
+                "raw_bytes": pac_stats.raw_bytes,
+                "coverage": round(pac_stats.coverage, 4),
+                "issues": pac_stats.issues,
+            }
+            total = totals.setdefault(pac_stats.game, PacStats(game=pac_stats.game))
+            total.size += pac_stats.size
+            total.known_bytes += pac_stats.known_bytes
+            total.unknown_bytes += pac_stats.unknown_bytes
+            total.string_table_bytes += pac_stats.string_table_bytes
+            total.jump_table_bytes += pac_stats.jump_table_bytes
+            total.raw_bytes += pac_stats.raw_bytes
+            total.issues += pac_stats.issues
+            for opcode, sizes in pac_stats.opcodes.items():
+                total.opcodes.setdefault(opcode, Counter()).update(sizes)
+
+    games_json: Dict[str, Any] = {}
+    coverage_table = Table(
+        "Game",
+        "Files",
+        "Bytes",
+        "Known",
+        "Strings",
+        "Jumps",
+        "unk_",
+        "Raw",
+        "Coverage",
+        "Opcodes",
+    )
+    opcodes_table = Table("Game", "Opcode", "Name", "Count", "Bytes", "Params sizes")
+    for decoder in [Decoder(g) for g in games if g in totals]:
+        total = totals[decoder.game]
+        opcodes_json: Dict[str, Any] = {}
+        for (inst_id, inst_subid), sizes in sorted(
+            total.opcodes.items(), key=lambda item: -sum(item[1].values())
+        ):
+            inst = decoder.instructions_set.get((inst_id, inst_subid))
+            opcodes_json[f"{inst_id:02X}_{inst_subid:04X}"] = {
+                "name": inst.type_name if inst else None,
+                "count": sum(sizes.values()),
+                "bytes": sum([(s + 4) * n for s, n in sizes.items()]),
+                "params_sizes": dict(sorted(sizes.items())),
+            }
+        unused = [
+            inst.type_name
+            for opcode, inst in decoder.instructions_set.items()
+            if opcode not in total.opcodes
+        ]
+        num_files = len([f for f in files.values() if f["game"] == decoder.game])
+        games_json[decoder.game.value] = {
+            "files": num_files,
+            "size": total.size,
+            "known_bytes": total.known_bytes,
+            "unknown_bytes": total.unknown_bytes,
+            "string_table_bytes": total.string_table_bytes,
+            "jump_table_bytes": total.jump_table_bytes,
+            "raw_bytes": total.raw_bytes,
+            "coverage": round(total.coverage, 4),
+            "issues": total.issues,
+            "defined_opcodes": len(decoder.instructions_set),
+            "hit_opcodes": len(decoder.instructions_set) - len(unused),
+            "unused": unused,
+            "opcodes": opcodes_json,
+        }
+
+        size = max(total.size, 1)
+        coverage_table.add_row(
+            decoder.game.value,
+            str(num_files),
+            str(total.size),
+            f"{total.known_bytes / size:.2%}",
+            f"{total.string_table_bytes / size:.2%}",
+            f"{total.jump_table_bytes / size:.2%}",
+            f"{total.unknown_bytes / size:.2%}",
+            f"{total.raw_bytes / size:.2%}",
+            f"{total.coverage:.2%}",
+            f"{len(decoder.instructions_set) - len(unused)}/{len(decoder.instructions_set)}",
+        )
+        for opcode, opcode_json in list(opcodes_json.items())[:top]:
+            opcodes_table.add_row(
+                decoder.game.value,
+                opcode,
+                opcode_json["name"] or "",
+                str(opcode_json["count"]),
+                str(opcode_json["bytes"]),
+                ", ".join([str(s) for s in opcode_json["params_sizes"]]),
+            )
+
+    with open(output, "w", encoding="utf-8") as outfile:
+        json.dump({"games": games_json, "files": files}, outfile, indent=2)
+    console.print(coverage_table)
+    console.print(opcodes_table)
+    print(f'Stats of {len(files)} PAC files written to "{output}"')
+    if num_errors > 0:
+        print(f"{num_errors} PAC files with errors skipped")
+
+
+@app.command()
+def cache(
+    input: Path = typer.Argument(..., help="PAC file or folder path"),
+    game: Game = typer.Option(
+        Game.P3, show_default="P3", case_sensitive=False, help="Patapon game"
+    ),
+    detect: bool = typer.Option(
+        False, help="Detect the game of each PAC file, --game breaks the ties"
+    ),
+    output: Path = typer.Option(
+        Path("pac.cache"), "--output", "-o", help="Cache file path"
+    ),
+    compression: Compression = typer.Option(
+        Compression.NONE, case_sensitive=False, help="Cache compression"
+    ),
+    resilient: bool = typer.Option(
+        False, help="Keep malformed instructions as RAW_BYTES and skip broken files"
+    ),
+    jobs: int = typer.Option(
+        os.cpu_count(), "--jobs", "-j", show_default="CPU count", help="Processes"
+    ),
+):
+    print(f"{text2art('PAC Viewer', font='tarty2').rstrip()} by efonte\n")
+    if compression == Compression.ZSTD and zstandard is None:
+        print("zstd compression needs the zstandard package")
+        raise typer.Exit(1)
+    pac_list = get_pac_list(input)
+    root = input if input.is_dir() else input.parent
+    games = get_games(game, detect)
+
+    writer = CacheWriter()
+    num_cached = 0
+    num_errors = 0
+    console = Console()
+    with console.status(f"Decoding {len(pac_list)} PAC files"):
+        try:
+            results = map_pac_list(
+                partial(decode_file, resilient=resilient), pac_list, games, jobs
+            )
+            for pac_path, (report, instructions) in zip(pac_list, results):
+                if report.error:
+                    num_errors += 1
+                    print(f'Error "{report.path}": {report.error}')
+                    continue
+                path = pac_path.relative_to(root).as_posix()
+                writer.add(path, report.game, instructions)
+                num_cached += 1
+        except DecodeError as e:
+            print(f"Error {e}")
+            raise typer.Exit(1)
+    with console.status(f'Writing "{output}"'):
+        writer.write(output, compression)
+    print(f'{num_cached} PAC files cached in "{output}"')
+    if resilient:
+        print(f"{num_errors} PAC files with errors skipped")
+
+
+@app.command()
+def strings_import(
+    translations: Path = typer.Argument(..., help="Translated PO/CSV file path"),
+    input: Path = typer.Argument(..., help="PAC file or folder used to extract"),
+    output: Path = typer.Option(
+        ..., "--output", "-o", help="Folder for the translated PAC files"
+    ),
+):
+    print(f"{text2art('PAC Viewer', font='tarty2').rstrip()} by efonte\n")
+    root = input if input.is_dir() else input.parent
+
+    # PAC path -> [(offset, original bytes, translated bytes)]
+    patches: Dict[str, List[Tuple[int, bytes, bytes]]] = {}
+    num_skipped = 0
+    for entry in read_strings(translations):
+        if entry.translation == "" or entry.translation == entry.text:
+            continue
+        text_bytes = entry.text.encode("shift_jis")
+        try:
+            translation_bytes = entry.translation.encode("shift_jis")
+        except UnicodeEncodeError:
+            print(f'Skipping "{entry.translation}": not encodable as shift_jis')
+            num_skipped += 1
+            continue
+        if len(translation_bytes) > len(text_bytes):
+            # Strings are referenced by offset, they can't be moved or grown
+            print(
+                f'Skipping "{entry.translation}": longer than "{entry.text}" '
+                f"({len(translation_bytes)} > {len(text_bytes)} bytes)"
+            )
+            num_skipped += 1
+            continue
+        translation_bytes += b"\x00" * (len(text_bytes) - len(translation_bytes))
+        for path, offset in entry.refs:
+            patches.setdefault(path, []).append((offset, text_bytes, translation_bytes))
+
+    num_patched = 0
+    num_files = 0
+    for path, file_patches in patches.items():
+        try:
+            data = bytearray(root.joinpath(path).read_bytes())
+        except FileNotFoundError:
+            print(f'Skipping "{path}": PAC file not found in "{root}"')
+            num_skipped += len(file_patches)
+            continue
+        for offset, text_bytes, translation_bytes in file_patches:
+            if data[offset : offset + len(text_bytes)] != text_bytes:
+                print(f'Skipping {path}:{offset:08X}: "{text_bytes}" not found')
+                num_skipped += 1
+                continue
+            data[offset : offset + len(text_bytes)] = translation_bytes
+            num_patched += 1
+        output_path = output.joinpath(path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        output_path.write_bytes(data)
+        num_files += 1
+
+    print(
+        f'{num_patched} strings patched in {num_files} PAC files written to "{output}"'
+        f" ({num_skipped} skipped)"
+    )
 
 
 if __name__ == "__main__":